@@ -2,17 +2,81 @@ import frappe
 import pdfkit
 import markdown2
 import base64
+import hashlib
 import os
 import re
 import tempfile
 import io
+from functools import lru_cache
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from bs4 import BeautifulSoup
 from pypdf import PdfReader, PdfWriter
 from frappe.core.doctype.file.utils import find_file_by_url
 from urllib.parse import urlparse, unquote
+from werkzeug.wrappers import Response
 from frappe import _
 
+# cmarkgfm (C binding around GitHub's cmark) parses markdown 10-50x faster than
+# markdown2 and natively supports tables, fenced code, strikethrough,
+# break-on-newline and footnotes. Optional: fall back to markdown2 when the
+# wheel isn't available (source-only installs).
+try:
+    import cmarkgfm
+    from cmarkgfm.cmark import Options as _CmarkOptions
+    _CMARK_OPTS = (
+        _CmarkOptions.CMARK_OPT_UNSAFE
+        | _CmarkOptions.CMARK_OPT_HARDBREAKS
+        | _CmarkOptions.CMARK_OPT_FOOTNOTES
+    )
+except ImportError:
+    cmarkgfm = None
+
+# selectolax (lexbor C parser) lets _clean_for_pdf rewrite media/details/tables
+# in one DOM walk instead of several full-document regex passes. Optional —
+# the regex path stays as the fallback.
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# WeasyPrint renders in-process (no wkhtmltopdf subprocess spawn) and honors
+# page-break-inside:avoid on table rows natively, which removes the need to
+# split large tables ourselves. Optional — wkhtmltopdf stays the default path.
+try:
+    import weasyprint
+except ImportError:
+    weasyprint = None
+
+# Precomputed escape table — str.translate walks the string once in C,
+# noticeably cheaper than html.escape across thousands of titles/labels.
+_ESC = str.maketrans({
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "'": "&#x27;",
+})
+
+
+def _use_weasyprint():
+    # Opt-in via site_config so existing installs keep wkhtmltopdf:
+    # "wiki_pdf_use_weasyprint": 1
+    if weasyprint is None:
+        return False
+    try:
+        return bool(frappe.conf.get("wiki_pdf_use_weasyprint"))
+    except Exception:
+        return False
+
+
+def _weasyprint_url_fetcher(url):
+    """Refuse network fetches — everything we feed WeasyPrint is local
+    (file:// stylesheet, file:// images) or inlined as data: URIs."""
+    if url.startswith(("http:", "https:")):
+        return {"string": b"", "mime_type": "text/css"}
+    return weasyprint.default_url_fetcher(url)
+
 
 
 # ✅ ADD THIS BLOCK HERE ↓↓↓
@@ -194,19 +258,23 @@ _MD_EXTRAS = ["tables", "fenced-code-blocks", "strike", "cuddled-lists", "break-
 def _md_to_html(text):
     """Robust markdown to HTML conversion with table-hiding to avoid markdown2 crashes."""
     if not text: return ""
+    if cmarkgfm:
+        try:
+            return cmarkgfm.github_flavored_markdown_to_html(text, options=_CMARK_OPTS)
+        except Exception as e:
+            frappe.log_error(f"cmarkgfm parsing error, falling back to markdown2: {str(e)}", "Wiki PDF Markdown Error")
     try:
         # Standard attempt
         return markdown2.markdown(text, extras=_MD_EXTRAS)
     except AssertionError:
-        # Markdown2 failed (likely due to a large HTML table). 
+        # Markdown2 failed (likely due to a large HTML table).
         # Hide tables, parse the rest, then re-insert.
-        import re
         tables = []
         def _hide(match):
             tables.append(match.group(0))
             return f"\n\nPROTECTEDTABLE{len(tables)-1}\n\n"
-        
-        hidden_md = re.sub(r'(<table[^>]*>.*?</table>)', _hide, text, flags=re.DOTALL | re.IGNORECASE)
+
+        hidden_md = _RE_MD_TABLE.sub(_hide, text)
         try:
             html = markdown2.markdown(hidden_md, extras=_MD_EXTRAS)
             for i, table_html in enumerate(tables):
@@ -221,6 +289,56 @@ def _md_to_html(text):
         frappe.log_error(f"Markdown parsing error: {str(e)}", "Wiki PDF Markdown Error")
         return f"<div>Error parsing content: {frappe.utils.escape_html(text[:100])}...</div>"
 
+# Memoize markdown -> cleaned HTML across requests. Keyed by a BLAKE2 digest
+# of the raw content (hashing is ~1 GB/s, negligible next to the saved parse
+# and regex work); the side dict only holds the content for the duration of a
+# cache miss so the LRU never pins large strings twice.
+_CONTENT_BY_SHA = {}
+
+@lru_cache(maxsize=1024)
+def _render_page_cached(sha, use_weasy):
+    return _clean_for_pdf(_md_to_html(_CONTENT_BY_SHA[sha]), use_weasy)
+
+def _render_page(content):
+    """Render one page's markdown to cleaned HTML, memoized by content hash.
+
+    The PDF backend is part of the cache key — cleaned HTML differs per
+    backend (table splitting is wkhtmltopdf-only), so toggling
+    wiki_pdf_use_weasyprint must not serve fragments cleaned for the
+    other engine.
+    """
+    content = content or ""
+    sha = hashlib.blake2b(content.encode(), digest_size=16).digest()
+    _CONTENT_BY_SHA[sha] = content
+    try:
+        return _render_page_cached(sha, _use_weasyprint())
+    finally:
+        _CONTENT_BY_SHA.pop(sha, None)
+
+def _rendered_html_cached(name, modified, content):
+    """Markdown -> cleaned HTML fragment, cached in Redis.
+
+    Unlike the in-process lru_cache this survives worker restarts and is
+    shared between web and background workers. Keyed by (name, modified,
+    backend): entries self-invalidate on edit because the key includes the
+    page's modified timestamp, and the backend tag keeps wkhtmltopdf- and
+    WeasyPrint-cleaned fragments apart (table splitting differs). The whole
+    hash is dropped on Wiki Page save as a belt-and-braces eviction.
+    """
+    use_weasy = _use_weasyprint()
+    key = f"{name}:{modified}:{'wp' if use_weasy else 'wk'}"
+    try:
+        cached = frappe.cache().hget("wiki_pdf_html", key)
+    except Exception:
+        cached = None
+    if cached is None:
+        cached = _clean_for_pdf(_md_to_html(content or ""), use_weasy)
+        try:
+            frappe.cache().hset("wiki_pdf_html", key, cached)
+        except Exception:
+            pass
+    return cached
+
 def _find_page(route):
     """Robust lookup for Wiki Page by route."""
     if not route: return None
@@ -286,58 +404,199 @@ def _inline_images(html):
             img["src"] = fallback
     return str(soup)
 
+# Precompiled once at import — re.sub with inline patterns pays a cache lookup
+# (and potential recompile) on every call, and these run on every page render.
+# One alternation means the document is scanned once for all rewrite rules
+# instead of once per rule.
+_RE_CLEAN_TAGS = re.compile(
+    r'<iframe[^>]*>.*?</iframe>'
+    r'|<video[^>]*>.*?</video>'
+    r'|<details[^>]*>'
+    r'|</details>'
+    r'|<summary[^>]*>'
+    r'|</summary>',
+    re.DOTALL | re.IGNORECASE,
+)
+_RE_SRC = re.compile(r'src=["\']([^"\']+)["\']')
+_RE_MD_TABLE = re.compile(r'(<table[^>]*>.*?</table>)', re.DOTALL | re.IGNORECASE)
+_RE_STYLESHEET_LINK = re.compile(r'<link[^>]+rel=["\']stylesheet["\'][^>]*>', re.IGNORECASE)
+_RE_TOC_ANCHOR = re.compile(r'[GP]TOC[\s]*-[\s]*\d+(?:[\s]*-[\s]*\d+)?')
+_RE_WS = re.compile(r'\s+')
+
+def _clean_dispatch(m):
+    tok = m.group(0)
+    head = tok[:10].lower()
+    if head.startswith(("<iframe", "<video")):
+        src = _RE_SRC.search(tok)
+        return _media_link_div(src.group(1)) if src else tok
+    if head.startswith("<details"):
+        return '<div style="display:block;margin:6pt 0;">'
+    if head.startswith("</details"):
+        return '</div>'
+    if head.startswith("<summary"):
+        return '<span style="font-weight:bold;">'
+    return '</span><br>'  # </summary>
+
+# Force each chunk to stay on one page if possible (Atomic Chunks)
+TABLE_STYLE = 'width:100%;border-collapse:collapse;table-layout:fixed;font-size:10pt;margin:0;page-break-inside:avoid !important;'
+
+# Static fragments of the split-table markup, bound once — the chunk loop
+# assembles each sub-table with a single tuple join.
+_SUB_TABLE_PREFIX = f'<table style="{TABLE_STYLE}">'
+_CONTINUED_HTML = '<div style="font-size:9pt;color:#555;text-align:right;margin-top:4pt;">(continued...)</div>'
+
+def _find_element(src, lower, tag, pos=0):
+    """Locate `<tag ...> ... </tag>` via str.find. Returns (start, end) or None."""
+    start = lower.find(f'<{tag}', pos)
+    if start == -1:
+        return None
+    end = lower.find(f'</{tag}>', start)
+    if end == -1:
+        return None
+    return start, end + len(tag) + 3
+
+def _scan_rows(src, lower):
+    """Collect all `<tr>...</tr>` spans left to right in one pass."""
+    # Bound methods hoisted out of the loop — this runs once per row of every
+    # table, so attribute lookups add up on large documents.
+    find = lower.find
+    rows = []
+    append = rows.append
+    pos = 0
+    while True:
+        start = find('<tr', pos)
+        if start == -1:
+            return rows
+        end = find('</tr>', start)
+        if end == -1:
+            return rows
+        end += 5
+        append(src[start:end])
+        pos = end
+
+def _process_table(table_html, max_rows):
+    lower = table_html.lower()
+
+    tbody = _find_element(table_html, lower, 'tbody')
+    if tbody:
+        gt = table_html.find('>', tbody[0])
+        row_src = table_html[gt + 1:tbody[1] - len('</tbody>')]
+        rows = _scan_rows(row_src, row_src.lower())
+    else:
+        rows = _scan_rows(table_html, lower)
+
+    if len(rows) <= max_rows:
+        # Re-stamp the opening tag with the atomic-chunk style
+        gt = table_html.find('>')
+        return f'{table_html[:gt]} style="{TABLE_STYLE}">{table_html[gt + 1:]}'
+
+    thead_span = _find_element(table_html, lower, 'thead')
+    if thead_span:
+        thead = table_html[thead_span[0]:thead_span[1]]
+    else:
+        first = _find_element(table_html, lower, 'tr')
+        thead = f'<thead>{table_html[first[0]:first[1]]}</thead>' if first else ''
+
+    colgroup_span = _find_element(table_html, lower, 'colgroup')
+    colgroup = table_html[colgroup_span[0]:colgroup_span[1]] if colgroup_span else ''
+
+    parts = []
+    for idx, i in enumerate(range(0, len(rows), max_rows)):
+        parts.append("".join((
+            _CONTINUED_HTML if idx > 0 else '',
+            _SUB_TABLE_PREFIX, colgroup, thead,
+            '<tbody>', "".join(rows[i:i + max_rows]), '</tbody></table>',
+        )))
+    return '\n<div style="margin:4pt 0;"></div>\n'.join(parts)
+
 def _split_tables(html, max_rows=25):
-    """Splits large tables into groups of `max_rows` rows so page-break-inside:avoid works."""
-    def _get_thead(table_html):
-        m = re.search(r'(<thead[^>]*>.*?</thead>)', table_html, re.DOTALL | re.IGNORECASE)
-        if m: return m.group(1)
-        first = re.search(r'(<tr[^>]*>.*?</tr>)', table_html, re.DOTALL | re.IGNORECASE)
-        return f'<thead>{first.group(1)}</thead>' if first else ''
-
-    def _get_colgroup(table_html):
-        m = re.search(r'(<colgroup[^>]*>.*?</colgroup>)', table_html, re.DOTALL | re.IGNORECASE)
-        return m.group(1) if m else ''
-
-    def _get_tbody_rows(table_html):
-        tbody = re.search(r'<tbody[^>]*>(.*?)</tbody>', table_html, re.DOTALL | re.IGNORECASE)
-        src = tbody.group(1) if tbody else table_html
-        return re.findall(r'<tr[^>]*>.*?</tr>', src, re.DOTALL | re.IGNORECASE)
-
-    # Force each chunk to stay on one page if possible (Atomic Chunks)
-    TABLE_STYLE = 'width:100%;border-collapse:collapse;table-layout:fixed;font-size:10pt;margin:0;page-break-inside:avoid !important;'
-
-    def process_table(match):
-        table_html = match.group(0)
-        thead, colgroup, rows = _get_thead(table_html), _get_colgroup(table_html), _get_tbody_rows(table_html)
-        if len(rows) <= max_rows:
-            return re.sub(r'<table([^>]*)>', lambda m: f'<table{m.group(1)} style="{TABLE_STYLE}">', table_html, 1, re.IGNORECASE)
-
-        chunks = [rows[i:i + max_rows] for i in range(0, len(rows), max_rows)]
-        parts = []
-        for idx, chunk in enumerate(chunks):
-            continued = f'<div style="font-size:9pt;color:#555;text-align:right;margin-top:4pt;">(continued...)</div>' if idx > 0 else ''
-            parts.append(f'{continued}<table style="{TABLE_STYLE}">{colgroup}{thead}<tbody>{"".join(chunk)}</tbody></table>')
-        return '\n<div style="margin:4pt 0;"></div>\n'.join(parts)
-
-    return re.sub(r'<table[^>]*>.*?</table>', process_table, html, flags=re.DOTALL | re.IGNORECASE)
-
-def _clean_for_pdf(html):
-    def replace_media(match):
-        src = re.search(r'src=["\']([^"\']+)["\']', match.group(0))
-        if src:
-            url = src.group(1)
-            if "youtube.com/embed/" in url:
-                video_id = url.split("embed/")[1].split("?")[0]
-                url = f"https://www.youtube.com/watch?v={video_id}"
-            return f'<div style="border:1px solid #ccc;background:#f9f9f9;padding:6pt 10pt;margin:6pt 0;"><a href="{url}">Watch Video: {url}</a></div>'
-        return match.group(0)
-
-    html = re.sub(r'<(iframe|video)[^>]*>.*?</\1>', replace_media, html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<details[^>]*>', '<div style="display:block;margin:6pt 0;">', html, flags=re.IGNORECASE)
-    html = re.sub(r'</details>', '</div>', html, flags=re.IGNORECASE)
-    html = re.sub(r'<summary[^>]*>', '<span style="font-weight:bold;">', html, flags=re.IGNORECASE)
-    html = re.sub(r'</summary>', '</span><br>', html, flags=re.IGNORECASE)
-    return _split_tables(html)
+    """Splits large tables into groups of `max_rows` rows so page-break-inside:avoid works.
+
+    Single left-to-right str.find scan — no DOTALL regex passes over the
+    document, and non-table content is copied through untouched.
+    """
+    lower = html.lower()
+    out = []
+    pos = 0
+    while True:
+        span = _find_element(html, lower, 'table', pos)
+        if not span:
+            out.append(html[pos:])
+            return "".join(out)
+        out.append(html[pos:span[0]])
+        out.append(_process_table(html[span[0]:span[1]], max_rows))
+        pos = span[1]
+
+_YT_EMBED_RE = re.compile(r'youtube\.com/embed/([A-Za-z0-9_\-]{6,})')
+
+def _embed_to_watch(url):
+    """Turn a YouTube embed URL into its watch URL; other URLs pass through."""
+    m = _YT_EMBED_RE.search(url)
+    return f"https://www.youtube.com/watch?v={m.group(1)}" if m else url
+
+def _media_link_div(url):
+    url = _embed_to_watch(url)
+    return f'<div style="border:1px solid #ccc;background:#f9f9f9;padding:6pt 10pt;margin:6pt 0;"><a href="{url}">Watch Video: {url}</a></div>'
+
+def _clean_for_pdf_dom(html, use_weasy):
+    """Single-pass DOM rewrite of _clean_for_pdf using selectolax/lexbor.
+
+    Walks the document once instead of running one regex pass per rule, which
+    matters on large pages where each pass re-scans and re-allocates the whole
+    string. Raises on any parser surprise so the caller can fall back to regex.
+    """
+    tree = LexborHTMLParser(html)
+
+    for node in tree.css("iframe, video"):
+        src = node.attributes.get("src") or ""
+        replacement = LexborHTMLParser(_media_link_div(src)).body.child
+        node.replace_with(replacement)
+
+    # wkhtmltopdf's WebKit doesn't know <details>/<summary>; style them to
+    # render like the div/span conversion the regex path does.
+    for node in tree.css("details"):
+        node.attrs["style"] = "display:block;margin:6pt 0;"
+    for node in tree.css("summary"):
+        node.attrs["style"] = "display:block;font-weight:bold;"
+
+    if not use_weasy:
+        for node in tree.css("table"):
+            # _split_tables may emit several sibling tables; wrap them so one
+            # replacement node carries the whole group.
+            node.replace_with(LexborHTMLParser(f"<div>{_split_tables(node.html)}</div>").body.child)
+
+    body_html = tree.body.html  # "<body>...</body>"
+    return body_html[len("<body>"):-len("</body>")]
+
+_CLEAN_NEEDLES = ('<iframe', '<video', '<details', '<summary', '<table')
+
+def _clean_for_pdf(html, use_weasy=None):
+    # Most pages are plain prose with none of the tags we rewrite; a C-level
+    # substring scan is ~100x cheaper than running the regex/DOM pipeline
+    # just to find nothing.
+    if not html:
+        return html
+    if use_weasy is None:
+        use_weasy = _use_weasyprint()
+    lowered = html.lower()
+    # Raw HTML pasted into wiki content can carry external stylesheet links;
+    # the PDF engine would fetch and parse each one only to have PDF_CSS
+    # override everything anyway.
+    if '<link' in lowered:
+        html = _RE_STYLESHEET_LINK.sub('', html)
+    if not any(n in lowered for n in _CLEAN_NEEDLES):
+        return html
+
+    if LexborHTMLParser:
+        try:
+            return _clean_for_pdf_dom(html, use_weasy)
+        except Exception:
+            pass  # fall back to the regex pipeline below
+
+    html = _RE_CLEAN_TAGS.sub(_clean_dispatch, html)
+    # WeasyPrint honors page-break-inside:avoid on <tr>, so table splitting
+    # is only needed for the wkhtmltopdf backend.
+    return html if use_weasy else _split_tables(html)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # CSS & FOOTER
@@ -412,6 +671,50 @@ FOOTER_STYLE = """
 </style>
 """
 
+# Full-bleed image page (cover / back cover) — one module-level template
+# instead of two identical multi-KB literals rebuilt per request.
+_IMAGE_PAGE_HTML = """
+<html><head><meta charset='UTF-8'><style>
+    html, body {{ margin: 0; padding: 0; width: 100%; height: 100%; overflow: hidden; background-color: white; }}
+    table {{ width: 100%; height: 100%; border-collapse: collapse; }}
+    td {{ margin: 0; padding: 0; vertical-align: middle; text-align: center; }}
+    img {{ width: 100%; height: auto; display: block; margin: 0; }}
+</style></head>
+<body><table><tr><td><img src="data:{mime};base64,{encoded}"></td></tr></table></body>
+</html>
+"""
+
+_FULLBLEED_PDF_OPTS = {"page-size": "A4", "margin-top": "0", "margin-bottom": "0", "margin-left": "0", "margin-right": "0", "quiet": ""}
+
+# The cover images are immutable bundled assets — memoize the File lookup
+# and base64 encode for the life of the worker. Misses are NOT cached so a
+# cover uploaded later is picked up without a restart.
+_COVER_HTML_CACHE = {}
+
+def _cover_image_html(file_url, name_like):
+    """Build the full-bleed image page HTML for a bundled File, or None."""
+    cached = _COVER_HTML_CACHE.get(file_url)
+    if cached is not None:
+        return cached
+    page_html = _build_cover_image_html(file_url, name_like)
+    if page_html:
+        _COVER_HTML_CACHE[file_url] = page_html
+    return page_html
+
+def _build_cover_image_html(file_url, name_like):
+    f_name = frappe.db.get_value("File", {"file_url": file_url}, "name")
+    if not f_name:
+        f_name = frappe.db.get_value("File", {"file_name": ["like", name_like]}, "name")
+    if not f_name:
+        return None
+    f_doc = frappe.get_cached_doc("File", f_name)
+    content = f_doc.get_content()
+    if not content:
+        return None
+    encoded = base64.b64encode(content).decode()
+    mime = "image/jpeg" if f_doc.file_name.lower().endswith((".jpg", ".jpeg")) else "image/png"
+    return _IMAGE_PAGE_HTML.format(mime=mime, encoded=encoded)
+
 def _add_page_numbers(pdf_bin, skip_first=False, skip_last=False, skip_count=1):
     """Adds page numbers using a single pdfkit call for all pages (prevents worker timeout on large docs)."""
     try:
@@ -472,19 +775,19 @@ def _add_page_numbers(pdf_bin, skip_first=False, skip_last=False, skip_count=1):
 def _post_process_pdf(main_html, groups, lang_code="en"):
     """Generates PDF with manual TOC post-processing."""
     # 1. Add invisible anchors to groups and pages
-    anchor_html = []
+    parts = []
     for g_idx, group in enumerate(groups):
         g_id = f"GTOC-{g_idx}"
         group["anchor"] = g_id
         # Apply page break to the group container itself (except for the first group)
         gb = 'style="page-break-before:always;"' if g_idx > 0 else ""
-        
-        parts = [f'<div {gb}>']
+
+        parts.append(f'<div {gb}>')
         # Anchor: inline, white text on white bg, 1pt — stays in PDF text layer for pypdf extraction
         parts.append(f'<span style="color:#ffffff;font-size:1pt;line-height:0;">{g_id}</span>')
 
         if group["label"]:
-            parts.append(f'<h1 class="group-name">{group["label"]}</h1>')
+            parts.append(f'<h1 class="group-name">{group["label"].translate(_ESC)}</h1>')
 
         for p_idx, page in enumerate(group["pages"]):
             p_id = f"PTOC-{g_idx}-{p_idx}"
@@ -493,41 +796,20 @@ def _post_process_pdf(main_html, groups, lang_code="en"):
             # If we already had a group label/header, we don't need another break for the first page
             pb = 'style="page-break-before:always;"' if (p_idx > 0 or (g_idx > 0 and not group["label"])) else ""
             tag = "h2" if group["label"] else "h1"
-            title_with_num = f"{page['number']} {page['title']}" if page.get("number") else page["title"]
+            # Titles are user-authored — escape so '<' or '&' can't produce
+            # malformed markup that the PDF engine has to recover from.
+            esc_title = (page["title"] or "").translate(_ESC)
+            title_with_num = f"{page['number']} {esc_title}" if page.get("number") else esc_title
             parts.append(f'<div {pb}>{p_div}<{tag} class="page-title">{title_with_num}</{tag}>{page["content_html"]}</div>')
-        
+
         parts.append('</div>')
-        anchor_html.append("\n".join(parts))
 
-    full_body = "\n".join(anchor_html)
+    # Single flat list + one join — no per-group intermediate strings
+    full_body = "\n".join(parts)
     content_html = _inline_images(_wrap(full_body))
     
-    # 2. Generate Cover & Title Pages
-    from frappe.utils.pdf import get_pdf
-    
-    # 2a. Page 1: Image Cover
-    cover_pdf_bin = None
-    f_name = frappe.db.get_value("File", {"file_url": "/files/CrecheFrontpage.jpg"}, "name")
-    if not f_name:
-        f_name = frappe.db.get_value("File", {"file_name": ["like", "%CrecheFrontpage%"]}, "name")
-    
-    if f_name:
-        f_doc = frappe.get_doc("File", f_name)
-        content = f_doc.get_content()
-        if content:
-            encoded = base64.b64encode(content).decode()
-            mime = "image/jpeg" if f_doc.file_name.lower().endswith((".jpg", ".jpeg")) else "image/png"
-            image_html = f"""
-            <html><head><meta charset='UTF-8'><style>
-                html, body {{ margin: 0; padding: 0; width: 100%; height: 100%; overflow: hidden; background-color: white; }}
-                table {{ width: 100%; height: 100%; border-collapse: collapse; }}
-                td {{ margin: 0; padding: 0; vertical-align: middle; text-align: center; }}
-                img {{ width: 100%; height: auto; display: block; margin: 0; }}
-            </style></head>
-            <body><table><tr><td><img src="data:{mime};base64,{encoded}"></td></tr></table></body>
-            </html>
-            """
-            cover_pdf_bin = get_pdf(image_html, options={"page-size": "A4", "margin-top": "0", "margin-bottom": "0", "margin-left": "0", "margin-right": "0", "quiet": ""})
+    # 2. Build Cover & Back Cover page HTML (DB work stays on this thread)
+    cover_page_html = _cover_image_html("/files/CrecheFrontpage.jpg", "%CrecheFrontpage%")
 
     # # 2b. Page 2: Text Title
     # title_html = """
@@ -542,31 +824,21 @@ def _post_process_pdf(main_html, groups, lang_code="en"):
     # title_pdf_bin = get_pdf(title_html, options={"page-size": "A4", "margin-top": "0", "margin-bottom": "0", "margin-left": "0", "margin-right": "0", "quiet": ""})
 
     # 2c. Back Cover
-    back_cover_pdf_bin = None
-    b_name = frappe.db.get_value("File", {"file_url": "/files/crechebackpage.jpg"}, "name")
-    if not b_name:
-        b_name = frappe.db.get_value("File", {"file_name": ["like", "%crechebackpage%"]}, "name")
-    
-    if b_name:
-        b_doc = frappe.get_doc("File", b_name)
-        b_content = b_doc.get_content()
-        if b_content:
-            b_encoded = base64.b64encode(b_content).decode()
-            b_mime = "image/jpeg" if b_doc.file_name.lower().endswith((".jpg", ".jpeg")) else "image/png"
-            b_image_html = f"""
-            <html><head><meta charset='UTF-8'><style>
-                html, body {{ margin: 0; padding: 0; width: 100%; height: 100%; overflow: hidden; background-color: white; }}
-                table {{ width: 100%; height: 100%; border-collapse: collapse; }}
-                td {{ margin: 0; padding: 0; vertical-align: middle; text-align: center; }}
-                img {{ width: 100%; height: auto; display: block; margin: 0; }}
-            </style></head>
-            <body><table><tr><td><img src="data:{b_mime};base64,{b_encoded}"></td></tr></table></body>
-            </html>
-            """
-            back_cover_pdf_bin = get_pdf(b_image_html, options={"page-size": "A4", "margin-top": "0", "margin-bottom": "0", "margin-left": "0", "margin-right": "0", "quiet": ""})
-
-    # 3. Generate content PDF
-    content_pdf = pdfkit.from_string(content_html, False, options=_pdf_options(None))
+    back_cover_page_html = _cover_image_html("/files/crechebackpage.jpg", "%crechebackpage%")
+
+    # 3. Generate cover, back cover and content PDFs in parallel — each is an
+    # independent render dominated by a wkhtmltopdf subprocess. Workers call
+    # pdfkit/weasyprint directly (no frappe.local access off the request
+    # thread), so resolve the backend choice here and hand it in.
+    use_weasy = _use_weasyprint()
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        content_future = ex.submit(_render_pdf, content_html, _pdf_options(None), use_weasy)
+        cover_future = ex.submit(pdfkit.from_string, cover_page_html, False, _FULLBLEED_PDF_OPTS) if cover_page_html else None
+        back_future = ex.submit(pdfkit.from_string, back_cover_page_html, False, _FULLBLEED_PDF_OPTS) if back_cover_page_html else None
+        content_pdf = content_future.result()
+        cover_pdf_bin = cover_future.result() if cover_future else None
+        back_cover_pdf_bin = back_future.result() if back_future else None
+
     if not content_pdf:
         frappe.log_error("Content PDF generation failed (empty result)")
         return b""
@@ -579,9 +851,9 @@ def _post_process_pdf(main_html, groups, lang_code="en"):
     page_map = {}
     for i, page in enumerate(reader.pages):
         text = page.extract_text() or ""
-        matches = re.findall(r'[GP]TOC[\s]*-[\s]*\d+(?:[\s]*-[\s]*\d+)?', text)
+        matches = _RE_TOC_ANCHOR.findall(text)
         for m in matches:
-            key = re.sub(r'\s+', '', m)  # normalize: "GTOC -0" → "GTOC-0"
+            key = _RE_WS.sub('', m)  # normalize: "GTOC -0" → "GTOC-0"
             if key not in page_map:
                 page_map[key] = i + 1
 
@@ -594,25 +866,26 @@ def _post_process_pdf(main_html, groups, lang_code="en"):
         for g_idx, group in enumerate(groups):
             if group["label"]:
                 p_num = page_map.get(group["anchor"], 1) + shift
-                title = f"{group['number']}. {group['label']}"
+                title = f"{group['number']}. {group['label'].translate(_ESC)}"
                 toc_lines.append(f'<div class="toc-item level-0"><span class="toc-page">{p_num}</span><span class="toc-title">{title}</span><div class="toc-line"></div></div>')
             for p_idx, page in enumerate(group["pages"]):
                 p_num = page_map.get(page["anchor"], 1) + shift
-                title = f"{page['number']} {page['title']}"
+                title = f"{page['number']} {(page['title'] or '').translate(_ESC)}"
                 level = "level-1" if group["label"] else "level-0"
                 toc_lines.append(f'<div class="toc-item {level}"><span class="toc-page">{p_num}</span><span class="toc-title">{title}</span><div class="toc-line"></div></div>')
         toc_lines.append('</div>')
         return f"<html><head><meta charset='UTF-8'>{TOC_STYLE}</head><body>{''.join(toc_lines)}</body></html>"
 
-    # Pass 1: Estimate TOC size
-    toc_pdf = pdfkit.from_string(build_toc(0), False, options=_pdf_options(None))
+    # Pass 1: Estimate TOC size (same backend as the content document so the
+    # merged PDF has uniform geometry)
+    toc_pdf = _render_pdf(build_toc(0), _pdf_options(None), use_weasy)
     toc_page_count = len(PdfReader(io.BytesIO(toc_pdf)).pages)
-    
+
     # Pass 2: Final TOC with correct page shifts (Cover + Title + TOC pages)
-    skip_c = (1 if cover_pdf_bin else 0) 
+    skip_c = (1 if cover_pdf_bin else 0)
     # + (1 if title_pdf_bin else 0)
     shift_amount = skip_c + toc_page_count
-    toc_pdf = pdfkit.from_string(build_toc(shift_amount), False, options=_pdf_options(None))
+    toc_pdf = _render_pdf(build_toc(shift_amount), _pdf_options(None), use_weasy)
     toc_reader = PdfReader(io.BytesIO(toc_pdf))
     
     # 5. Merge
@@ -664,7 +937,7 @@ def _compress_pdf_gs(pdf_bin, label=""):
     """Compress PDF using Ghostscript (font subsetting + image recompression).
     Falls back to original bytes if gs is unavailable or compression makes it larger.
     """
-    import subprocess, tempfile
+    import subprocess
     tmp_in = tmp_out = None
     try:
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
@@ -709,8 +982,6 @@ def _compress_pdf_gs(pdf_bin, label=""):
 
 def _save_pdf_to_cache(cache_fname, pdf_bin):
     """Compress, write PDF to disk, and create/update a File record."""
-    import os
-
     pdf_bin = _compress_pdf_gs(pdf_bin, label=cache_fname)
 
     file_path = os.path.join(frappe.get_site_path("public", "files"), cache_fname)
@@ -758,7 +1029,6 @@ def _save_pdf_to_cache(cache_fname, pdf_bin):
 
 def _load_pdf_from_cache(cache_fname):
     """Read cached PDF bytes from disk. Returns None if not found."""
-    import os
     file_path = os.path.join(frappe.get_site_path("public", "files"), cache_fname)
     if os.path.exists(file_path):
         with open(file_path, "rb") as f:
@@ -783,8 +1053,53 @@ def _pdf_options(footer_path, toc_xsl_path=None):
     }
     return opts
 
+_CSS_PATH = None
+
+def _css_path():
+    """Write PDF_CSS to a stable site-private file once and return its path.
+
+    Linking the stylesheet instead of inlining it shrinks every generated
+    HTML document by ~3 KB and lets the renderer cache the parsed CSS.
+    Returns None when no site context is available (caller inlines instead).
+    """
+    global _CSS_PATH
+    if _CSS_PATH and os.path.exists(_CSS_PATH):
+        return _CSS_PATH
+    try:
+        path = os.path.join(frappe.get_site_path("private", "files"), "wiki_pdf.css")
+        # Rewrite when the bundled CSS changed so a stale file can't linger
+        # across app updates.
+        if not os.path.exists(path) or open(path).read() != PDF_CSS:
+            with open(path, "w") as f:
+                f.write(PDF_CSS)
+        _CSS_PATH = path
+    except Exception:
+        _CSS_PATH = None
+    return _CSS_PATH
+
+def _render_pdf(html, options=None, use_weasy=None):
+    """Render an A4 document to PDF bytes.
+
+    Uses WeasyPrint in-process when available (page geometry comes from the
+    @page CSS rule), otherwise shells out to wkhtmltopdf via pdfkit.
+    `use_weasy` lets callers resolve the backend choice up front —
+    _use_weasyprint() reads frappe.conf, which is thread-local and unbound
+    in pool workers, so the decision must be made on the request thread.
+    """
+    if use_weasy is None:
+        use_weasy = _use_weasyprint()
+    if use_weasy:
+        return weasyprint.HTML(string=html, url_fetcher=_weasyprint_url_fetcher).write_pdf()
+    return pdfkit.from_string(html, False, options=options or _pdf_options(None))
+
 def _wrap(body):
-    return f"<html><head><meta charset='UTF-8'><style>{PDF_CSS}</style></head><body>{body}</body></html>"
+    css_path = _css_path()
+    if css_path:
+        # enable-local-file-access is already set in _pdf_options
+        head = f"<link rel='stylesheet' type='text/css' href='file://{css_path}'>"
+    else:
+        head = f"<style>{PDF_CSS}</style>"
+    return f"<html><head><meta charset='UTF-8'>{head}</head><body>{body}</body></html>"
 
 # ─────────────────────────────────────────────────────────────────────────────
 # MAIN ENDPOINTS
@@ -871,7 +1186,6 @@ def _wrap(body):
 @frappe.whitelist(allow_guest=True)
 def check_wiki_pdf_status(lang="en"):
     """Lightweight check — returns {ready, url} without streaming the file through Python."""
-    import os
     lang_code = get_normalized_lang(lang)
     cache_fname = f"WikiPDF_DailyCache_{lang_code}.pdf"
     file_path = os.path.join(frappe.get_site_path("public", "files"), cache_fname)
@@ -893,11 +1207,14 @@ def check_wiki_pdf_status(lang="en"):
 def download_wiki_pdf(page_name=None, route=None, lang="en"):
     try:
         lang_code = get_normalized_lang(lang)
-        pdf_bin = _load_pdf_from_cache(f"WikiPDF_DailyCache_{lang_code}.pdf")
-        if pdf_bin:
-            frappe.local.response.filename = "Creche_Guideline.pdf"
-            frappe.local.response.filecontent = pdf_bin
-            frappe.local.response.type = "download"
+        cache_fname = f"WikiPDF_DailyCache_{lang_code}.pdf"
+        file_path = os.path.join(frappe.get_site_path("public", "files"), cache_fname)
+        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            # Redirect to the static file so the web server streams it —
+            # the PDF never gets buffered through Python (can be 10+ MB).
+            # The frontend fetch() follows the redirect transparently.
+            frappe.local.response.type = "redirect"
+            frappe.local.response.location = f"/files/{cache_fname}"
             return
 
         # PDF not cached — trigger generation for this language and tell user to wait
@@ -963,15 +1280,29 @@ def download_wiki_pdf(page_name=None, route=None, lang="en"):
 #             frappe.log_error(frappe.get_traceback(), "Wiki Full Space PDF Error")
 #             frappe.throw(f"Error: {str(e)}")
 
+def _pdf_download_response(pdf_bin, etag):
+    """Build a Werkzeug response carrying the PDF and its ETag.
+
+    Frappe's "download" response builder only emits Content-Disposition and
+    the body — it never reads custom headers — so the ETag has to travel on
+    a real Response object, which frappe.handler passes through untouched.
+    set_etag also quotes the entity-tag as RFC 7232 requires.
+    """
+    response = Response(pdf_bin, mimetype="application/pdf")
+    response.headers["Content-Disposition"] = 'attachment; filename="Creche_Guideline.pdf"'
+    response.set_etag(etag)
+    return response
+
+
 @frappe.whitelist(allow_guest=True)
 def download_full_wiki_space(wiki_space, lang="en"):
     """Download entire space by wiki_space route name."""
     try:
-        root_name = frappe.get_doc(
-            "Wiki Page",
-            {"route": wiki_space},
-            ignore_permissions=True
-        ).name
+        # Only the name is needed — skip the full doc load (all fields plus
+        # child tables) that get_doc would do.
+        root_name = frappe.db.get_value("Wiki Page", {"route": wiki_space}, "name")
+        if not root_name:
+            frappe.throw(_("Wiki Page not found: {0}").format(wiki_space))
 
         # ✅ CHECK CACHE FIRST (daily pre-generated takes priority)
         lang_code = get_normalized_lang(lang)
@@ -980,48 +1311,75 @@ def download_full_wiki_space(wiki_space, lang="en"):
             f"WikiPDF_DailyCache_{lang_code}.pdf",
             fallback_space_cache_fname
         ]:
-            file_doc_name = frappe.db.get_value("File", {"file_name": cache_fname}, "name")
-            if file_doc_name:
-                cached_file = frappe.get_doc("File", file_doc_name)
-                frappe.local.response.filename = "Creche_Guideline.pdf"
-                frappe.local.response.filecontent = cached_file.get_content()
-                frappe.local.response.type = "download"
+            cache_path = os.path.join(frappe.get_site_path("public", "files"), cache_fname)
+            if os.path.exists(cache_path) and os.path.getsize(cache_path) > 0:
+                # Redirect so the web server streams the file — the PDF is
+                # never buffered through Python on the warm path.
+                frappe.local.response.type = "redirect"
+                frappe.local.response.location = f"/files/{cache_fname}"
                 return
 
-        all_pages = frappe.get_all(
+        # Memoize the rendered PDF on (space, lang, newest page modification):
+        # repeat downloads of unchanged content become a single Redis fetch
+        # instead of a full markdown -> translate -> wkhtmltopdf run. The same
+        # fingerprint doubles as the HTTP ETag so browsers can skip even the
+        # Redis fetch with a 304.
+        max_modified = frappe.db.sql(
+            "SELECT MAX(modified) FROM `tabWiki Page` WHERE published = 1"
+        )[0][0]
+        etag = hashlib.blake2b(
+            f"{root_name}|{lang_code}|{max_modified}|v1".encode()
+        ).hexdigest()
+        cache_key = f"wiki_pdf:{etag}"
+
+        # werkzeug parses If-None-Match into an ETags set, so quoting and
+        # multi-value headers are handled for us.
+        request = getattr(frappe, "request", None)
+        if request is not None and request.if_none_match.contains(etag):
+            not_modified = Response(status=304)
+            not_modified.set_etag(etag)
+            return not_modified
+
+        cached_bin = frappe.cache().get_value(cache_key)
+        if cached_bin:
+            return _pdf_download_response(cached_bin, etag)
+
+        # Filter in SQL — fetching every published page site-wide only to
+        # discard most of them in Python transfers MBs of unrelated content.
+        pages = frappe.get_all(
             "Wiki Page",
             filters={"published": 1},
-            fields=["name", "title", "content", "parent_wiki_page"],
+            or_filters=[
+                ["name", "=", root_name],
+                ["parent_wiki_page", "=", root_name],
+            ],
+            fields=["name", "title", "content", "modified", "parent_wiki_page"],
             order_by="creation asc",
             ignore_permissions=True,
             limit=0
         )
 
-        pages = [
-            p for p in all_pages
-            if p.name == root_name or p.parent_wiki_page == root_name
-        ]
-
         if not pages:
             frappe.throw(_("No content found to generate PDF"))
 
-        processed_pages = []
-
-        for p in pages:
-            raw_html = _md_to_html(p.content or "")
-
-            if lang and lang != "en":
-                translated_html = translate_html(raw_html, lang)
+        if lang_code == "en":
+            # No translation step — the memoized per-page pipeline applies
+            processed_pages = [
+                {"title": p.title, "content_html": _render_page(p.content)}
+                for p in pages
+            ]
+        else:
+            processed_pages = []
+            for p in pages:
+                # The markdown+clean stage is content-deterministic — pull it
+                # from the shared Redis cache; only translation runs per call.
+                clean_html = _rendered_html_cached(p.name, p.modified, p.content)
+                translated_html = translate_html(clean_html, lang)
                 translated_title = translate_text(p.title, lang)
-            else:
-                translated_html = raw_html
-                translated_title = p.title
-
-            # ✅ ALWAYS append (fixed indentation)
-            processed_pages.append({
-                "title": translated_title,
-                "content_html": _clean_for_pdf(translated_html)
-            })
+                processed_pages.append({
+                    "title": translated_title,
+                    "content_html": translated_html
+                })
 
         # ✅ Generate PDF OUTSIDE loop
         pdf_bin = _post_process_pdf(None, [{
@@ -1031,13 +1389,12 @@ def download_full_wiki_space(wiki_space, lang="en"):
 
         # ✅ SAVE CACHE
         try:
+            frappe.cache().set_value(cache_key, pdf_bin, expires_in_sec=3600)
             _save_pdf_to_cache(fallback_space_cache_fname, pdf_bin)
         except Exception:
             pass
 
-        frappe.local.response.filename = "Creche_Guideline.pdf"
-        frappe.local.response.filecontent = pdf_bin
-        frappe.local.response.type = "download"
+        return _pdf_download_response(pdf_bin, etag)
 
     except Exception as e:
         frappe.log_error(frappe.get_traceback(), "Wiki Full Space PDF Error")
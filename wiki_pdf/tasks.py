@@ -65,7 +65,7 @@ def generate_pdf_for_single_language(lang):
     - The DB connection is fresh per job (avoids MySQL gone-away after long translation)
     """
     from wiki_pdf.pdf import (
-        _md_to_html, _clean_for_pdf, _post_process_pdf,
+        _rendered_html_cached, _post_process_pdf,
         translate_html, get_normalized_lang, _save_pdf_to_cache
     )
 
@@ -74,45 +74,28 @@ def generate_pdf_for_single_language(lang):
     frappe.logger().info(f"Wiki PDF: Starting generation for lang={lang_code}")
 
     try:
-        sidebar_parents = frappe.get_all("Wiki Group Item", fields=["parent"], limit=1)
-        if not sidebar_parents:
-            frappe.logger().warning("Wiki PDF: No Wiki Group Items found.")
-            return
-
-        sidebar_parent = sidebar_parents[0].parent
-        sidebar = frappe.get_all(
-            "Wiki Group Item",
-            filters={"parent": sidebar_parent},
-            fields=["wiki_page", "parent_label"],
-            order_by="idx asc",
-            ignore_permissions=True,
-            limit=0,
+        # One JOIN instead of three round-trips (first parent, sidebar items,
+        # then page contents) — rows come back already ordered by sidebar idx.
+        rows = frappe.db.sql(
+            """
+            SELECT wp.name, wp.title, wp.content, wp.modified, wgi.parent_label
+            FROM `tabWiki Group Item` wgi
+            JOIN `tabWiki Page` wp ON wp.name = wgi.wiki_page
+            WHERE wgi.parent = (SELECT parent FROM `tabWiki Group Item` LIMIT 1)
+            ORDER BY wgi.idx ASC
+            """,
+            as_dict=True,
         )
-
-        p_names = [s.wiki_page for s in sidebar if s.wiki_page]
-        if not p_names:
+        if not rows:
             frappe.logger().warning("Wiki PDF: No wiki pages found in sidebar.")
             return
 
-        p_map = {
-            p.name: p for p in frappe.get_all(
-                "Wiki Page",
-                filters={"name": ["in", p_names]},
-                fields=["name", "title", "content"],
-                ignore_permissions=True,
-                limit=0,
-            )
-        }
-
         groups = []
         group_counter = 1
         ref_counter = 1
 
-        for s in sidebar:
-            if s.wiki_page not in p_map:
-                continue
-            p = p_map[s.wiki_page]
-            label = s.parent_label or ""
+        for p in rows:
+            label = p.parent_label or ""
 
             if not groups or groups[-1]["raw_label"] != label:
                 translated_label = _safe_translate(label, lang_code) if label else label
@@ -126,8 +109,10 @@ def generate_pdf_for_single_language(lang):
                 group_counter += 1
                 ref_counter = 1
 
-            raw_html = _md_to_html(p.content or "")
-            translated_html = translate_html(raw_html, lang_code)
+            # The markdown+clean stage comes from the shared Redis cache —
+            # across 20+ language jobs it renders once, not once per language.
+            clean_html = _rendered_html_cached(p.name, p.modified, p.content)
+            translated_html = translate_html(clean_html, lang_code)
             translated_title = _safe_translate(p.title, lang_code)
 
             full_number = f"{groups[-1]['number']}.{ref_counter}"
@@ -135,7 +120,7 @@ def generate_pdf_for_single_language(lang):
                 "number": full_number,
                 "title": translated_title,
                 "anchor": f"PTOC-{full_number.replace('.', '-')}",
-                "content_html": _clean_for_pdf(translated_html)
+                "content_html": translated_html
             })
             ref_counter += 1
             time.sleep(0.5)
@@ -220,6 +205,13 @@ def on_wiki_page_save(doc, method):
     from wiki_pdf.pdf import get_normalized_lang
 
     # 15-minute cooldown — only enqueue once per editing window
+    # Rendered-fragment cache entries are keyed by (name, modified) so they
+    # self-invalidate, but drop the hash anyway so edits can't serve stale HTML.
+    try:
+        frappe.cache().delete_value("wiki_pdf_html")
+    except Exception:
+        pass
+
     cooldown_key = "wiki_pdf_regen_pending"
     if frappe.cache().get_value(cooldown_key):
         return
@@ -15,18 +15,18 @@ def get_context(context):
             "route": ["like", f"{wiki}/%"],
             "published": 1,
         },
-        fields=["name", "title", "route"],
+        fields=["name", "title", "route", "content"],
         order_by="idx asc",
     )
 
-    html = ""
+    # Accumulate into a list — repeated += on a growing string is quadratic
+    parts = []
     for p in pages:
-        doc = frappe.get_doc("Wiki Page", p.name)
-        html += f"<h1>{doc.title}</h1>"
-        html += doc.content or ""
-        html += "<hr>"
+        parts.append(f"<h1>{p.title}</h1>")
+        parts.append(p.content or "")
+        parts.append("<hr>")
 
-    pdf = get_pdf(html)
+    pdf = get_pdf("".join(parts))
 
     frappe.local.response.filename = f"{wiki}.pdf"
     frappe.local.response.filecontent = pdf